@@ -36,6 +36,7 @@ extras_require = {
     ],
     'dev': [
         "bumpversion",
+        "filelock>=3.0,<4",
         "flaky>=3.7.0,<4",
         "hypothesis>=3.31.2,<6",
         "pytest>=4.4.0,<5.0.0",
@@ -1,10 +1,19 @@
+from concurrent.futures import (
+    ThreadPoolExecutor,
+)
+import functools
+import hashlib
 import json
 import os
 from pathlib import (
     Path,
 )
 import pytest
+import shutil
+import signal
 import subprocess
+import tempfile
+import time
 import zipfile
 
 from eth_utils import (
@@ -12,26 +21,90 @@ from eth_utils import (
     is_dict,
     to_text,
 )
+from filelock import (
+    FileLock,
+)
+
+from tests.utils import (
+    release_reserved_ports,
+)
 
 from .utils import (
+    SharedGethProcess,
+    cached_responses,
+    is_process_alive,
     kill_proc_gracefully,
+    shared_value,
 )
 
 KEYFILE_PW = 'web3py-test'
 
 GETH_FIXTURE_ZIP = 'geth-1.10.13-fixture.zip'
 
+TEST_CACHE_DIR = Path(
+    os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache'))
+) / 'web3py-tests'
+
+# sha256 of the genesis file a datadir was last initialized with
+GENESIS_HASH_FILENAME = '.genesis.sha256'
+
+# how long the worker which started a shared geth waits for the others
+SHARED_GETH_TEARDOWN_TIMEOUT = 600
+
+
+def _raise_keyboard_interrupt(signum, frame):
+    raise KeyboardInterrupt()
+
+
+def pytest_configure(config):
+    # pytest runs fixture finalizers on KeyboardInterrupt but not on SIGTERM,
+    # which is how CI usually stops a run. Translate one into the other so a
+    # terminated run still shuts geth down and cleans up its datadir.
+    if signal.getsignal(signal.SIGTERM) is signal.SIG_DFL:
+        signal.signal(signal.SIGTERM, _raise_keyboard_interrupt)
+
+
+def pytest_unconfigure(config):
+    if signal.getsignal(signal.SIGTERM) is _raise_keyboard_interrupt:
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
 
-@pytest.fixture(scope='module')
-def geth_binary():
-    from geth.install import (
-        get_executable_path,
-        install_geth,
-    )
 
+def _geth_cache_path():
+    # remembers the binary and version installed for GETH_VERSION, so later
+    # runs neither check for (and possibly install) the binary nor run it
+    if 'GETH_BINARY' in os.environ or 'GETH_VERSION' not in os.environ:
+        return None
+    return TEST_CACHE_DIR / 'geth-bin-{0}'.format(os.environ['GETH_VERSION'])
+
+
+@functools.lru_cache(maxsize=None)
+def _read_geth_cache():
+    cache_path = _geth_cache_path()
+    if cache_path is None:
+        return None
+    try:
+        cached = json.loads(cache_path.read_text())
+    except (OSError, ValueError):
+        return None
+    if not os.access(cached['binary'], os.X_OK):
+        return None
+    return cached
+
+
+@functools.lru_cache(maxsize=None)
+def _resolve_geth_binary():
     if 'GETH_BINARY' in os.environ:
         return os.environ['GETH_BINARY']
     elif 'GETH_VERSION' in os.environ:
+        cached = _read_geth_cache()
+        if cached is not None:
+            return cached['binary']
+
+        from geth.install import (
+            get_executable_path,
+            install_geth,
+        )
+
         geth_version = os.environ['GETH_VERSION']
         _geth_binary = get_executable_path(geth_version)
         if not os.path.exists(_geth_binary):
@@ -42,6 +115,49 @@ def geth_binary():
         return 'geth'
 
 
+@functools.lru_cache(maxsize=None)
+def _resolve_geth_version(geth_binary):
+    cached = _read_geth_cache()
+    if cached is not None and cached['binary'] == geth_binary:
+        import semantic_version
+        return semantic_version.Version(cached['version'])
+
+    from geth import get_geth_version
+    version = get_geth_version(geth_executable=os.path.expanduser(geth_binary))
+
+    cache_path = _geth_cache_path()
+    if cache_path is not None:
+        TEST_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        tmp_cache_path = cache_path.with_name('{0}.{1}.tmp'.format(cache_path.name, os.getpid()))
+        tmp_cache_path.write_text(json.dumps({'binary': geth_binary, 'version': str(version)}))
+        os.rename(str(tmp_cache_path), str(cache_path))
+    return version
+
+
+@functools.lru_cache(maxsize=None)
+def _prefetch_geth():
+    # overlaps a possible geth install with the tests before the first geth one
+    executor = ThreadPoolExecutor(max_workers=1)
+    future = executor.submit(lambda: _resolve_geth_version(_resolve_geth_binary()))
+    executor.shutdown(wait=False)
+    return future
+
+
+@pytest.hookimpl(trylast=True)
+def pytest_collection_modifyitems(session, config, items):
+    # after -k/-m deselection, so only when geth tests are actually run
+    if config.option.collectonly:
+        return
+    if any('geth_binary' in getattr(item, 'fixturenames', ()) for item in items):
+        _prefetch_geth()
+
+
+@pytest.fixture(scope='module')
+def geth_binary():
+    _prefetch_geth().result()
+    return _resolve_geth_binary()
+
+
 def absolute_datadir(directory_name):
     return os.path.abspath(os.path.join(
         os.path.dirname(__file__),
@@ -52,8 +168,7 @@ def absolute_datadir(directory_name):
 
 @pytest.fixture(scope="module")
 def get_geth_version(geth_binary):
-    from geth import get_geth_version
-    return get_geth_version(geth_executable=os.path.expanduser(geth_binary))
+    return _resolve_geth_version(geth_binary)
 
 
 @pytest.fixture(scope="module")
@@ -73,30 +188,81 @@ def geth_zipfile_version(get_geth_version):
     raise AssertionError("Unsupported geth version")
 
 
-@pytest.fixture(scope='module')
-def datadir(tmpdir_factory, geth_zipfile_version):
-    zipfile_path = absolute_datadir(geth_zipfile_version)
-    base_dir = tmpdir_factory.mktemp('goethereum')
-    tmp_datadir = os.path.join(str(base_dir), 'datadir')
-    with zipfile.ZipFile(zipfile_path, 'r') as zip_ref:
-        zip_ref.extractall(tmp_datadir)
-    return tmp_datadir
+def _worker_id(config):
+    # like pytest-xdist's ``worker_id`` fixture, which is missing without it
+    return getattr(config, 'workerinput', {}).get('workerid', 'master')
 
 
-@pytest.fixture(scope="module")
-def geth_fixture_data(datadir):
-    config_file_path = Path(datadir) / 'config.json'
-    return json.loads(config_file_path.read_text())
+@pytest.fixture(scope='session')
+def geth_tmp_root(request, tmp_path_factory):
+    worker_id = _worker_id(request.config)
+    run_dir = tmp_path_factory.getbasetemp()
+    if worker_id != 'master':
+        run_dir = run_dir.parent
 
+    # removed again once the last xdist worker is done with it
+    ramdisk = os.environ.get('TEST_RAMDISK')
+    if not ramdisk or not os.access(ramdisk, os.W_OK):
+        yield run_dir
+        return
 
-@pytest.fixture(scope='module')
-def genesis_file(datadir):
-    genesis_file_path = os.path.join(datadir, 'genesis.json')
-    return genesis_file_path
+    ramdisk_root = Path(ramdisk, 'web3py-{0}'.format('-'.join(run_dir.parts[-2:])))
+    users_dir = ramdisk_root / 'workers'
+    lock = FileLock(str(run_dir / 'ramdisk.lock'))
+    with lock:
+        users_dir.mkdir(parents=True, exist_ok=True)
+        (users_dir / worker_id).touch()
+
+    yield ramdisk_root
+
+    with lock:
+        (users_dir / worker_id).unlink()
+        if not any(users_dir.iterdir()):
+            shutil.rmtree(str(ramdisk_root), ignore_errors=True)
 
 
 @pytest.fixture(scope='module')
-def geth_process(geth_binary, datadir, genesis_file, geth_command_arguments):
+def geth_shared_dir(request, geth_tmp_root):
+    # shared by the xdist workers running this module, to run a single geth
+    if _worker_id(request.config) == 'master':
+        return None
+    shared_dir = geth_tmp_root / request.module.__name__
+    shared_dir.mkdir(exist_ok=True)
+    return shared_dir
+
+
+def _hardlink_tree(src, dst):
+    # LevelDB's .ldb tables are never modified once written, but geth appends
+    # to other files in place, which must not leak back into ``src``
+    os.makedirs(str(dst))
+    for entry in os.scandir(str(src)):
+        dst_path = os.path.join(str(dst), entry.name)
+        if entry.is_dir(follow_symlinks=False):
+            _hardlink_tree(entry.path, dst_path)
+        elif entry.name.endswith('.ldb'):
+            try:
+                os.link(entry.path, dst_path)
+            except OSError:
+                # e.g. EXDEV when ``dst`` lives on TEST_RAMDISK
+                shutil.copy2(entry.path, dst_path)
+        else:
+            shutil.copy2(entry.path, dst_path)
+
+
+def _genesis_hash(genesis_file):
+    return hashlib.sha256(Path(genesis_file).read_bytes()).hexdigest()
+
+
+def _is_datadir_initialized(datadir, genesis_file):
+    genesis_hash_path = Path(datadir, GENESIS_HASH_FILENAME)
+    return (
+        Path(datadir, 'geth', 'chaindata', 'CURRENT').exists()
+        and genesis_hash_path.exists()
+        and genesis_hash_path.read_text() == _genesis_hash(genesis_file)
+    )
+
+
+def _init_datadir(geth_binary, datadir, genesis_file):
     init_datadir_command = (
         geth_binary,
         '--datadir', str(datadir),
@@ -108,30 +274,201 @@ def geth_process(geth_binary, datadir, genesis_file, geth_command_arguments):
         stdin=subprocess.PIPE,
         stderr=subprocess.PIPE,
     )
+    Path(datadir, GENESIS_HASH_FILENAME).write_text(_genesis_hash(genesis_file))
+
+
+def _store_cached_datadir(datadir, cache_path):
+    tmp_cache_path = cache_path.with_name('{0}.{1}.tmp'.format(cache_path.name, os.getpid()))
+    _hardlink_tree(datadir, tmp_cache_path)
+    try:
+        os.rename(str(tmp_cache_path), str(cache_path))
+    except OSError:
+        # another process populated the cache first
+        shutil.rmtree(str(tmp_cache_path), ignore_errors=True)
+
+
+@pytest.fixture(scope='module')
+def datadir_cache_path(get_geth_version, geth_zipfile_version):
+    zipfile_path = absolute_datadir(geth_zipfile_version)
+    cache_key = hashlib.sha256(Path(zipfile_path).read_bytes())
+    cache_key.update(str(get_geth_version).encode())
+    return TEST_CACHE_DIR / cache_key.hexdigest()
+
+
+@pytest.fixture(scope='module')
+def datadir(geth_tmp_root,
+            geth_binary,
+            geth_zipfile_version,
+            datadir_cache_path,
+            geth_shared_dir):
+    # initialized datadirs are cached in TEST_CACHE_DIR, keyed on the fixture
+    # zip and the geth version, and copied from there on later runs
+    def extract_datadir():
+        zipfile_path = absolute_datadir(geth_zipfile_version)
+        if geth_shared_dir is None:
+            base_dir = tempfile.mkdtemp(prefix='goethereum', dir=str(geth_tmp_root))
+        else:
+            base_dir = geth_shared_dir
+        tmp_datadir = os.path.join(str(base_dir), 'datadir')
+
+        cache_path = datadir_cache_path
+        if cache_path.is_dir():
+            _hardlink_tree(cache_path, tmp_datadir)
+        else:
+            with zipfile.ZipFile(zipfile_path, 'r') as zip_ref:
+                zip_ref.extractall(tmp_datadir)
+            _init_datadir(geth_binary, tmp_datadir, os.path.join(tmp_datadir, 'genesis.json'))
+            TEST_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+            _store_cached_datadir(tmp_datadir, cache_path)
+        return tmp_datadir
+
+    return shared_value(geth_shared_dir, 'datadir', extract_datadir)
+
+
+@pytest.fixture(scope="module")
+def geth_fixture_data(datadir):
+    config_file_path = Path(datadir) / 'config.json'
+    return json.loads(config_file_path.read_text())
+
+
+@pytest.fixture(scope='module')
+def genesis_file(datadir):
+    genesis_file_path = os.path.join(datadir, 'genesis.json')
+    return genesis_file_path
+
+
+def _start_geth_process(geth_binary, datadir, genesis_file, geth_command_arguments):
+    if not _is_datadir_initialized(datadir, genesis_file):
+        _init_datadir(geth_binary, datadir, genesis_file)
+    # geth's output is discarded unless VERBOSE_GETH_LOG is set, and even then
+    # goes to files rather than pipes: nothing reads the pipes until shutdown,
+    # and geth blocks once a full pipe buffer is not drained.
+    if os.environ.get('VERBOSE_GETH_LOG'):
+        logs = (tempfile.TemporaryFile(), tempfile.TemporaryFile())
+    else:
+        logs = None
+    release_reserved_ports()
     proc = subprocess.Popen(
         geth_command_arguments,
-        stdin=subprocess.PIPE,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
+        stdin=subprocess.DEVNULL,
+        stdout=logs[0] if logs else subprocess.DEVNULL,
+        stderr=logs[1] if logs else subprocess.DEVNULL,
     )
+    return proc, logs
+
+
+def _has_live_refs(refs_dir):
+    # refs of workers which died without releasing them are ignored
+    return any(is_process_alive(int(ref_path.read_text())) for ref_path in refs_dir.iterdir())
+
+
+def _stop_geth_process(proc, logs):
+    kill_proc_gracefully(proc)
+    if logs is None:
+        return
+
+    output, errors = logs
+    for log_file in logs:
+        log_file.seek(0)
+    print(
+        "Geth Process Exited:\n"
+        "stdout:{0}\n\n"
+        "stderr:{1}\n\n".format(
+            to_text(output.read()),
+            to_text(errors.read()),
+        )
+    )
+    for log_file in logs:
+        log_file.close()
+
+
+@pytest.fixture(scope='module')
+def geth_process(request,
+                 geth_binary,
+                 datadir,
+                 genesis_file,
+                 geth_command_arguments,
+                 geth_shared_dir):
+    if geth_shared_dir is None:
+        proc, logs = _start_geth_process(
+            geth_binary,
+            datadir,
+            genesis_file,
+            geth_command_arguments,
+        )
+        try:
+            yield proc
+        finally:
+            _stop_geth_process(proc, logs)
+        return
+
+    # Under xdist the first worker to get here starts geth and every worker
+    # registers its pid in ``refs``. The starting worker is the only one able
+    # to reap the process, so it waits for the others to release it, or die,
+    # before shutting it down. Should it die itself, the last worker to
+    # release geth stops it instead.
+    lock = FileLock(str(geth_shared_dir / 'geth.lock'))
+    pid_path = geth_shared_dir / 'geth.pid'
+    owner_path = geth_shared_dir / 'geth.owner'
+    refs_dir = geth_shared_dir / 'refs'
+    ref_path = refs_dir / _worker_id(request.config)
+    with lock:
+        refs_dir.mkdir(exist_ok=True)
+        if pid_path.exists() and is_process_alive(int(pid_path.read_text())):
+            proc = SharedGethProcess(int(pid_path.read_text()))
+        else:
+            proc, logs = _start_geth_process(
+                geth_binary,
+                datadir,
+                genesis_file,
+                geth_command_arguments,
+            )
+            pid_path.write_text(str(proc.pid))
+            owner_path.write_text(str(os.getpid()))
+        ref_path.write_text(str(os.getpid()))
+
     try:
         yield proc
     finally:
-        kill_proc_gracefully(proc)
-        output, errors = proc.communicate()
-        print(
-            "Geth Process Exited:\n"
-            "stdout:{0}\n\n"
-            "stderr:{1}\n\n".format(
-                to_text(output),
-                to_text(errors),
-            )
-        )
+        with lock:
+            ref_path.unlink()
+            if (
+                not isinstance(proc, subprocess.Popen)
+                and pid_path.exists()
+                and not is_process_alive(int(owner_path.read_text()))
+                and not _has_live_refs(refs_dir)
+            ):
+                pid_path.unlink()
+                kill_proc_gracefully(proc)
+        if isinstance(proc, subprocess.Popen):
+            deadline = time.time() + SHARED_GETH_TEARDOWN_TIMEOUT
+            while True:
+                with lock:
+                    if not _has_live_refs(refs_dir) or time.time() > deadline:
+                        pid_path.unlink()
+                        _stop_geth_process(proc, logs)
+                        break
+                time.sleep(0.1)
 
 
 @pytest.fixture(scope='module')
-def coinbase(web3):
-    return web3.eth.coinbase
+def geth_bootstrap_data(web3, geth_fixture_data, datadir_cache_path):
+    # only depends on the fixture chain, so cached next to the cached datadir
+    cache_path = datadir_cache_path.with_name(datadir_cache_path.name + '.responses.json')
+    with cached_responses(web3, cache_path, {'eth_coinbase', 'eth_getBlockByHash'}):
+        return {
+            'coinbase': web3.eth.coinbase,
+            'empty_block': web3.eth.get_block(geth_fixture_data['empty_block_hash']),
+            'block_with_txn': web3.eth.get_block(geth_fixture_data['block_with_txn_hash']),
+            'block_with_txn_with_log': web3.eth.get_block(
+                geth_fixture_data['block_hash_with_log']
+            ),
+        }
+
+
+@pytest.fixture(scope='module')
+def coinbase(geth_bootstrap_data):
+    return geth_bootstrap_data['coinbase']
 
 
 @pytest.fixture(scope="module")
@@ -159,11 +496,73 @@ def emitter_contract_address(emitter_contract, address_conversion_func):
     return address_conversion_func(emitter_contract.address)
 
 
-@pytest.fixture
-def unlocked_account(web3, unlockable_account, unlockable_account_pw):
-    web3.geth.personal.unlock_account(unlockable_account, unlockable_account_pw)
+@pytest.fixture(scope='module')
+def module_unlocked_accounts():
+    return set()
+
+
+@pytest.fixture(scope='module')
+def geth_account_lock(datadir):
+    # serializes tests which need the account unlocked, or may lock it,
+    # across the xdist workers sharing a geth process
+    return FileLock(os.path.join(os.path.dirname(datadir), 'account.lock'))
+
+
+@pytest.fixture(scope='module')
+def geth_account_unlocked_path(datadir):
+    # exists while the account is known to be unlocked without a time limit
+    return Path(os.path.dirname(datadir), 'account.unlocked')
+
+
+def _keep_account_unlocked(web3, account, password, unlocked_path):
+    if not unlocked_path.exists():
+        # a duration of 0 keeps the account unlocked until it is explicitly locked
+        web3.geth.personal.unlock_account(account, password, 0)
+        unlocked_path.touch()
+
+
+@pytest.fixture(scope='module')
+def module_unlocked_account(web3,
+                            unlockable_account,
+                            unlockable_account_pw,
+                            module_unlocked_accounts,
+                            geth_shared_dir,
+                            geth_account_lock,
+                            geth_account_unlocked_path):
+    with geth_account_lock:
+        _keep_account_unlocked(
+            web3,
+            unlockable_account,
+            unlockable_account_pw,
+            geth_account_unlocked_path,
+        )
+    module_unlocked_accounts.add(unlockable_account)
     yield unlockable_account
-    web3.geth.personal.lock_account(unlockable_account)
+    module_unlocked_accounts.discard(unlockable_account)
+    # other workers may still rely on a shared geth keeping it unlocked
+    if geth_shared_dir is None:
+        with geth_account_lock:
+            web3.geth.personal.lock_account(unlockable_account)
+            # already gone if a test using ``unlockable_account_dual_type`` ran last
+            if geth_account_unlocked_path.exists():
+                geth_account_unlocked_path.unlink()
+
+
+@pytest.fixture
+def unlocked_account(web3,
+                     module_unlocked_account,
+                     unlockable_account_pw,
+                     geth_account_lock,
+                     geth_account_unlocked_path):
+    with geth_account_lock:
+        # only costs a request after a test which may have locked it
+        _keep_account_unlocked(
+            web3,
+            module_unlocked_account,
+            unlockable_account_pw,
+            geth_account_unlocked_path,
+        )
+        yield module_unlocked_account
 
 
 @pytest.fixture(scope='module')
@@ -177,15 +576,40 @@ def unlockable_account(web3, coinbase):
 
 
 @pytest.fixture()
-def unlockable_account_dual_type(unlockable_account, address_conversion_func):
-    return address_conversion_func(unlockable_account)
+def unlockable_account_dual_type(request,
+                                 unlockable_account,
+                                 address_conversion_func,
+                                 geth_account_lock,
+                                 geth_account_unlocked_path):
+    with geth_account_lock:
+        yield address_conversion_func(unlockable_account)
+        # the test may have locked the account, see ``unlocked_account``
+        if 'unlocked_account_dual_type' not in request.fixturenames:
+            if geth_account_unlocked_path.exists():
+                geth_account_unlocked_path.unlink()
 
 
 @pytest.yield_fixture
-def unlocked_account_dual_type(web3, unlockable_account_dual_type, unlockable_account_pw):
-    web3.geth.personal.unlock_account(unlockable_account_dual_type, unlockable_account_pw)
-    yield unlockable_account_dual_type
-    web3.geth.personal.lock_account(unlockable_account_dual_type)
+def unlocked_account_dual_type(web3,
+                               unlockable_account,
+                               unlockable_account_dual_type,
+                               unlockable_account_pw,
+                               module_unlocked_accounts,
+                               geth_shared_dir,
+                               geth_account_unlocked_path):
+    if geth_shared_dir is None and unlockable_account not in module_unlocked_accounts:
+        web3.geth.personal.unlock_account(unlockable_account_dual_type, unlockable_account_pw)
+        yield unlockable_account_dual_type
+        web3.geth.personal.lock_account(unlockable_account_dual_type)
+    else:
+        # already kept unlocked for the rest of the module
+        _keep_account_unlocked(
+            web3,
+            unlockable_account,
+            unlockable_account_pw,
+            geth_account_unlocked_path,
+        )
+        yield unlockable_account_dual_type
 
 
 @pytest.fixture(scope="module")
@@ -196,15 +620,15 @@ def funded_account_for_raw_txn(geth_fixture_data):
 
 
 @pytest.fixture(scope="module")
-def empty_block(web3, geth_fixture_data):
-    block = web3.eth.get_block(geth_fixture_data['empty_block_hash'])
+def empty_block(geth_bootstrap_data):
+    block = geth_bootstrap_data['empty_block']
     assert is_dict(block)
     return block
 
 
 @pytest.fixture(scope="module")
-def block_with_txn(web3, geth_fixture_data):
-    block = web3.eth.get_block(geth_fixture_data['block_with_txn_hash'])
+def block_with_txn(geth_bootstrap_data):
+    block = geth_bootstrap_data['block_with_txn']
     assert is_dict(block)
     return block
 
@@ -215,8 +639,8 @@ def mined_txn_hash(geth_fixture_data):
 
 
 @pytest.fixture(scope="module")
-def block_with_txn_with_log(web3, geth_fixture_data):
-    block = web3.eth.get_block(geth_fixture_data['block_hash_with_log'])
+def block_with_txn_with_log(geth_bootstrap_data):
+    block = geth_bootstrap_data['block_with_txn_with_log']
     assert is_dict(block)
     return block
 
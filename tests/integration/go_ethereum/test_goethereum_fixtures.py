@@ -0,0 +1,104 @@
+pytest_plugins = ['pytester']
+
+
+STUB_CONFTEST = '''
+import os
+
+import pytest
+
+from tests.integration.go_ethereum.conftest import (  # noqa: F401
+    geth_account_lock,
+    geth_account_unlocked_path,
+    module_unlocked_account,
+    module_unlocked_accounts,
+    unlockable_account_dual_type,
+    unlocked_account,
+    unlocked_account_dual_type,
+)
+
+UNLOCKED = set()
+
+
+class StubPersonal:
+    def unlock_account(self, account, passphrase, duration=None):
+        UNLOCKED.add(account)
+        return True
+
+    def lock_account(self, account):
+        UNLOCKED.discard(account)
+        return True
+
+
+class StubGeth:
+    personal = StubPersonal()
+
+
+class StubWeb3:
+    geth = StubGeth()
+
+
+@pytest.fixture(scope='module')
+def web3():
+    return StubWeb3()
+
+
+@pytest.fixture(scope='module')
+def datadir(tmpdir_factory):
+    return os.path.join(str(tmpdir_factory.mktemp('goethereum')), 'datadir')
+
+
+@pytest.fixture(scope='module')
+def geth_shared_dir():
+    return None
+
+
+@pytest.fixture(scope='module')
+def unlockable_account():
+    return '0xdc544d1aa88ff8bbd2f2aec754b1f1e99e1812fd'
+
+
+@pytest.fixture(scope='module')
+def unlockable_account_pw():
+    return 'web3py-test'
+
+
+@pytest.fixture(scope='module')
+def address_conversion_func():
+    return lambda address: address
+'''
+
+
+def test_module_unlocked_account_teardown_after_lock_test(testdir):
+    testdir.makeconftest(STUB_CONFTEST)
+    testdir.makepyfile('''
+        from conftest import UNLOCKED
+
+        def test_unlocked_account(unlocked_account):
+            assert unlocked_account in UNLOCKED
+
+        def test_lock_account(web3, unlockable_account_dual_type):
+            web3.geth.personal.lock_account(unlockable_account_dual_type)
+    ''')
+    result = testdir.runpytest('-p', 'no:cacheprovider')
+    result.assert_outcomes(passed=2)
+
+
+def test_unlocked_account_unlocked_again_after_lock_test(testdir):
+    testdir.makeconftest(STUB_CONFTEST)
+    testdir.makepyfile('''
+        from conftest import UNLOCKED
+
+        def test_unlocked_account(unlocked_account):
+            assert unlocked_account in UNLOCKED
+
+        def test_lock_account(web3, unlockable_account_dual_type):
+            web3.geth.personal.lock_account(unlockable_account_dual_type)
+
+        def test_unlocked_account_dual_type(unlocked_account_dual_type):
+            assert unlocked_account_dual_type in UNLOCKED
+
+        def test_unlocked_account_again(unlocked_account):
+            assert unlocked_account in UNLOCKED
+    ''')
+    result = testdir.runpytest('-p', 'no:cacheprovider')
+    result.assert_outcomes(passed=4)
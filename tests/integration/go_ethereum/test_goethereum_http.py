@@ -1,8 +1,5 @@
 import pytest
 
-from tests.utils import (
-    get_open_port,
-)
 from web3 import Web3
 from web3._utils.module_testing.go_ethereum_personal_module import (
     GoEthereumAsyncPersonalModuleTest,
@@ -39,14 +36,15 @@ from .common import (
     GoEthereumVersionModuleTest,
 )
 from .utils import (
+    shared_open_port,
     wait_for_aiohttp,
     wait_for_http,
 )
 
 
 @pytest.fixture(scope="module")
-def rpc_port():
-    return get_open_port()
+def rpc_port(geth_shared_dir):
+    return shared_open_port(geth_shared_dir, 'rpc_port')
 
 
 @pytest.fixture(scope="module")
@@ -1,10 +1,12 @@
 import os
 import pytest
+import shutil
 import tempfile
 
-from tests.utils import (
-    get_open_port,
+from filelock import (
+    FileLock,
 )
+
 from web3 import Web3
 
 from .common import (
@@ -16,14 +18,19 @@ from .common import (
     GoEthereumVersionModuleTest,
 )
 from .utils import (
+    shared_open_port,
+    shared_value,
     wait_for_socket,
 )
 
+# unix socket paths are limited to 108 bytes on linux and 104 on macOS
+MAX_IPC_PATH_LENGTH = 100
+
 
-def _geth_command_arguments(geth_ipc_path,
+def _geth_command_arguments(geth_port,
+                            geth_ipc_path,
                             base_geth_command_arguments):
 
-    geth_port = get_open_port()
     yield from base_geth_command_arguments
     yield from (
         '--port', geth_port,
@@ -33,22 +40,39 @@ def _geth_command_arguments(geth_ipc_path,
 
 @pytest.fixture(scope='module')
 def geth_command_arguments(geth_ipc_path,
-                           base_geth_command_arguments):
+                           base_geth_command_arguments,
+                           geth_shared_dir):
 
     return _geth_command_arguments(
+        shared_open_port(geth_shared_dir, 'geth_port'),
         geth_ipc_path,
         base_geth_command_arguments
     )
 
 
 @pytest.fixture(scope='module')
-def geth_ipc_path(datadir):
-    geth_ipc_dir_path = tempfile.mkdtemp()
-    _geth_ipc_path = os.path.join(geth_ipc_dir_path, 'geth.ipc')
+def geth_ipc_path(datadir, geth_shared_dir):
+    def make_ipc_path():
+        # inside the datadir, so it is cleaned up along with it
+        ipc_path = os.path.join(datadir, 'geth.ipc')
+        if len(ipc_path) < MAX_IPC_PATH_LENGTH:
+            return ipc_path
+        ipc_dir = tempfile.mkdtemp(dir='/dev/shm' if os.path.isdir('/dev/shm') else None)
+        return os.path.join(ipc_dir, 'geth.ipc')
+
+    _geth_ipc_path = shared_value(geth_shared_dir, 'geth_ipc_path', make_ipc_path)
     yield _geth_ipc_path
 
-    if os.path.exists(_geth_ipc_path):
-        os.remove(_geth_ipc_path)
+    if _geth_ipc_path.startswith(datadir):
+        return
+    if geth_shared_dir is None:
+        shutil.rmtree(os.path.dirname(_geth_ipc_path), ignore_errors=True)
+        return
+    # only once the shared geth is stopped, which happens after this ran on
+    # every other worker using it, see ``geth_process``
+    with FileLock(str(geth_shared_dir / 'geth.lock')):
+        if not (geth_shared_dir / 'geth.pid').exists():
+            shutil.rmtree(os.path.dirname(_geth_ipc_path), ignore_errors=True)
 
 
 @pytest.fixture(scope="module")
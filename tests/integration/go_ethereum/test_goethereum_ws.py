@@ -4,7 +4,6 @@ from tests.integration.common import (
     MiscWebsocketTest,
 )
 from tests.utils import (
-    get_open_port,
     wait_for_ws,
 )
 from web3 import Web3
@@ -17,11 +16,14 @@ from .common import (
     GoEthereumTest,
     GoEthereumVersionModuleTest,
 )
+from .utils import (
+    shared_open_port,
+)
 
 
 @pytest.fixture(scope="module")
-def ws_port():
-    return get_open_port()
+def ws_port(geth_shared_dir):
+    return shared_open_port(geth_shared_dir, 'ws_port')
 
 
 @pytest.fixture(scope="module")
@@ -1,22 +1,108 @@
+import contextlib
+import ctypes
+import ctypes.util
+import json
+import os
+import select
 import signal
 import socket
+import subprocess
+import sys
 import time
 
 import aiohttp
+from filelock import (
+    FileLock,
+)
 import requests
 
+from tests.utils import (
+    get_open_port,
+    reserve_open_port,
+)
+from web3.middleware import (
+    construct_simple_cache_middleware,
+)
+
+
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+
+
+def _wait_for_path_inotify(path, timeout):
+    libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    fd = libc.inotify_init1(os.O_NONBLOCK)
+    if fd < 0:
+        raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+    try:
+        watch = libc.inotify_add_watch(
+            fd,
+            os.fsencode(os.path.dirname(path)),
+            IN_CREATE | IN_MOVED_TO,
+        )
+        if watch < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_add_watch failed')
+        deadline = time.time() + timeout
+        # the path may have been created before the watch was added, so check
+        # for it before every wait rather than parsing the event names.
+        while not os.path.exists(path) and time.time() < deadline:
+            readable, _, _ = select.select([fd], [], [], deadline - time.time())
+            if readable:
+                os.read(fd, 4096)
+    finally:
+        os.close(fd)
+
+
+def _wait_for_path_kqueue(path, timeout):
+    dir_fd = os.open(os.path.dirname(path), os.O_RDONLY)
+    kq = select.kqueue()
+    try:
+        kq.control([select.kevent(
+            dir_fd,
+            filter=select.KQ_FILTER_VNODE,
+            flags=select.KQ_EV_ADD | select.KQ_EV_CLEAR,
+            fflags=select.KQ_NOTE_WRITE,
+        )], 0, 0)
+        deadline = time.time() + timeout
+        while not os.path.exists(path) and time.time() < deadline:
+            kq.control(None, 1, deadline - time.time())
+    finally:
+        kq.close()
+        os.close(dir_fd)
+
+
+def _wait_for_path(path, timeout):
+    """
+    Block until ``path`` exists or ``timeout`` seconds have passed, waking on
+    filesystem events for the parent directory instead of polling.
+    """
+    try:
+        if sys.platform.startswith('linux'):
+            _wait_for_path_inotify(path, timeout)
+        elif hasattr(select, 'kqueue'):
+            _wait_for_path_kqueue(path, timeout)
+    except (AttributeError, OSError):
+        # no usable notification API, ``wait_for_socket`` falls back to polling
+        pass
+
 
 def wait_for_socket(ipc_path, timeout=30):
-    start = time.time()
-    while time.time() < start + timeout:
-        try:
-            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
-            sock.connect(ipc_path)
-            sock.settimeout(timeout)
-        except (FileNotFoundError, socket.error):
-            time.sleep(0.01)
-        else:
-            break
+    deadline = time.time() + timeout
+    _wait_for_path(ipc_path, timeout)
+    # geth may take a while to start listening, so back off exponentially
+    # and only pay for a socket once the path exists
+    delay = 0.001
+    while time.time() < deadline:
+        if os.path.exists(ipc_path):
+            try:
+                with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                    sock.connect(ipc_path)
+            except socket.error:
+                pass
+            else:
+                break
+        time.sleep(min(delay, max(deadline - time.time(), 0)))
+        delay = min(delay * 2, 0.1)
 
 
 def wait_for_http(endpoint_uri, timeout=60):
@@ -42,24 +128,121 @@ async def wait_for_aiohttp(endpoint_uri, timeout=60):
             break
 
 
-def wait_for_popen(proc, timeout):
-    start = time.time()
-    while time.time() < start + timeout:
-        if proc.poll() is None:
-            time.sleep(0.01)
-        else:
-            break
+def _wait_for_exit(proc, timeout):
+    try:
+        proc.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        return False
+    return True
 
 
 def kill_proc_gracefully(proc):
-    if proc.poll() is None:
-        proc.send_signal(signal.SIGINT)
-        wait_for_popen(proc, 13)
+    if proc.poll() is not None:
+        return
+
+    proc.send_signal(signal.SIGINT)
+    if _wait_for_exit(proc, 13):
+        return
+
+    proc.terminate()
+    if _wait_for_exit(proc, 5):
+        return
+
+    proc.kill()
+    _wait_for_exit(proc, 2)
+
+
+def shared_value(shared_dir, name, compute):
+    """
+    Return ``compute()``, evaluated only once for every process using
+    ``shared_dir``. ``None`` for ``shared_dir`` means nothing is shared.
+    """
+    if shared_dir is None:
+        return compute()
+    value_path = shared_dir / '{0}.json'.format(name)
+    with FileLock(str(shared_dir / '{0}.lock'.format(name))):
+        if not value_path.exists():
+            value_path.write_text(json.dumps(compute()))
+        return json.loads(value_path.read_text())
+
+
+def shared_open_port(shared_dir, name):
+    if shared_dir is None:
+        return reserve_open_port()
+    # not kept reserved, the worker starting geth may not be the one which
+    # picked it and could not release it
+    return shared_value(shared_dir, name, get_open_port)
+
+
+def is_process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class SharedGethProcess:
+    """
+    Stand-in for the ``subprocess.Popen`` of a geth process which was started
+    by another xdist worker.
+    """
+    def __init__(self, pid):
+        self.pid = pid
+
+    def poll(self):
+        if is_process_alive(self.pid):
+            return None
+        # the exit status of a process we did not start is not available
+        return 0
+
+    def wait(self, timeout=None):
+        deadline = None if timeout is None else time.time() + timeout
+        while self.poll() is None:
+            if deadline is not None and time.time() > deadline:
+                raise subprocess.TimeoutExpired('geth', timeout)
+            time.sleep(0.05)
+        return 0
+
+    def send_signal(self, sig):
+        try:
+            os.kill(self.pid, sig)
+        except ProcessLookupError:
+            pass
+
+    def terminate(self):
+        self.send_signal(signal.SIGTERM)
+
+    def kill(self):
+        self.send_signal(signal.SIGKILL)
+
+
+@contextlib.contextmanager
+def cached_responses(web3, cache_path, rpc_whitelist):
+    """
+    Serve the responses to requests for the ``rpc_whitelist`` methods from
+    ``cache_path``, asking the node and saving its responses only for those
+    not there yet, or for all of them when ``REFRESH_FIXTURES`` is set.
+    """
+    cache = {}
+    if cache_path.exists() and not os.environ.get('REFRESH_FIXTURES'):
+        cache = json.loads(cache_path.read_text())
+    cached_keys = set(cache)
 
-    if proc.poll() is None:
-        proc.terminate()
-        wait_for_popen(proc, 5)
+    # innermost, so every other middleware still processes the responses
+    web3.middleware_onion.inject(
+        construct_simple_cache_middleware(lambda: cache, rpc_whitelist),
+        'cached_responses',
+        layer=0,
+    )
+    try:
+        yield
+    finally:
+        web3.middleware_onion.remove('cached_responses')
 
-    if proc.poll() is None:
-        proc.kill()
-        wait_for_popen(proc, 2)
+    if set(cache) != cached_keys:
+        tmp_cache_path = cache_path.with_name('{0}.{1}.tmp'.format(cache_path.name, os.getpid()))
+        tmp_cache_path.write_text(json.dumps(cache))
+        os.replace(str(tmp_cache_path), str(cache_path))
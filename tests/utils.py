@@ -5,14 +5,42 @@ import time
 import websockets
 
 
-def get_open_port():
+# sockets bound by ``reserve_open_port``, see ``release_reserved_ports``
+_reserved_port_sockets = []
+
+
+def _bind_open_port():
     sock = socket.socket()
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if hasattr(socket, 'SO_REUSEPORT'):
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
     sock.bind(('127.0.0.1', 0))
+    return sock
+
+
+def get_open_port():
+    sock = _bind_open_port()
     port = sock.getsockname()[1]
     sock.close()
     return str(port)
 
 
+def reserve_open_port():
+    """
+    Like ``get_open_port``, but the port stays bound, so it can't be handed out
+    again, until ``release_reserved_ports`` is called right before starting the
+    process which is meant to listen on it.
+    """
+    sock = _bind_open_port()
+    _reserved_port_sockets.append(sock)
+    return str(sock.getsockname()[1])
+
+
+def release_reserved_ports():
+    while _reserved_port_sockets:
+        _reserved_port_sockets.pop().close()
+
+
 async def wait_for_ws(endpoint_uri, event_loop, timeout=60):
     start = time.time()
     while time.time() < start + timeout: